@@ -1,26 +1,42 @@
-from fastapi import FastAPI, Depends, HTTPException, status, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, status, BackgroundTasks, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 import uvicorn
 import asyncio
-from typing import List
+import sys
+from typing import List, Optional
 
 
 from models import *
 from auth import *
+from config import settings
 from database import db
-from ssh_manager import ssh_manager
+from cache import cache
+from ssh_manager import ssh_manager, BatchOutputError
 from email_service import email_service
-from security import validator
+from security import validator, normalize_command
 
 # Lifespan manager for startup/shutdown events
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print("Starting Remote Server Manager API")
+    # Blocking SSH and hashing work runs in this pool via asyncio.to_thread
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=settings.THREAD_POOL_WORKERS)
+    )
+    await db.connect()
+    await cache.connect()
+    await email_service.start()
+    await ssh_manager.start()
     yield
     # Shutdown
+    await ssh_manager.stop()
+    await email_service.stop()
+    await cache.close()
+    await db.close()
     print("Shutting down Remote Server Manager API")
 
 async def create_initial_admin():
@@ -44,7 +60,8 @@ app = FastAPI(
     title="Remote Server Manager API",
     description="API for managing remote Linux servers via SSH",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -99,16 +116,14 @@ async def update_profile(
 ):
     """Update user profile"""
     update_data = user_update.dict(exclude_unset=True)
-    success = await db.update_user(current_user['id'], update_data)
+    updated_user = await db.update_user(current_user['id'], update_data)
     
-    if not success:
+    if not updated_user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    # Get updated user
-    updated_user = await db.get_user_by_id(current_user['id'])
     return updated_user
 
 @app.delete("/api/profile")
@@ -126,21 +141,15 @@ async def delete_profile(current_user: dict = Depends(get_current_user)):
 
 # ========== SERVER MANAGEMENT ENDPOINTS ==========
 
-@app.post("/api/servers", response_model=dict)
-async def create_server(
+async def verify_server_connection(
+    server_id: str,
+    user: dict,
     server: ServerCreate,
-    current_user: dict = Depends(get_current_user)
+    action: Optional[str] = None
 ):
-    """Add a new server"""
-    # Test connection before saving
-    if server.use_password and not server.password:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Password required for password authentication"
-        )
-    
-    # Test SSH connection
-    test_success = ssh_manager.test_connection(
+    """Test SSH connectivity for a saved server and record the result"""
+    test_success = await asyncio.to_thread(
+        ssh_manager.test_connection,
         host=server.host,
         username=server.username,
         port=server.port,
@@ -148,29 +157,40 @@ async def create_server(
         ssh_key=server.ssh_key if not server.use_password else None
     )
     
+    connection_status = ConnectionStatus.OK if test_success else ConnectionStatus.FAILED
+    await db.update_server(server_id, user['id'], {"connection_status": connection_status.value})
+    
     if not test_success:
+        await email_service.send_connection_failed_notification(user['email'], server.name)
+    elif action:
+        await email_service.send_server_notification(user['email'], server.name, action)
+
+@app.post("/api/servers", response_model=dict)
+async def create_server(
+    server: ServerCreate,
+    background_tasks: BackgroundTasks,
+    current_user: dict = Depends(get_current_user)
+):
+    """Add a new server"""
+    if server.use_password and not server.password:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Failed to connect to server. Check credentials."
+            detail="Password required for password authentication"
         )
     
-    # Save server
+    # Save server, then test the SSH connection after responding
     server_data = server.dict()
+    server_data['connection_status'] = ConnectionStatus.PENDING.value
     server_id = await db.create_server(current_user['id'], server_data)
     
-    # Send email notification (in background)
-    asyncio.create_task(
-        email_service.send_server_notification(
-            current_user['email'],
-            server.name,
-            "added"
-        )
+    background_tasks.add_task(
+        verify_server_connection, server_id, current_user, server, "added"
     )
     
     return {
         "message": "Server added successfully",
         "server_id": server_id,
-        "test_connection": "successful"
+        "test_connection": ConnectionStatus.PENDING.value
     }
 
 @app.get("/api/servers", response_model=List[ServerResponse])
@@ -197,42 +217,29 @@ async def get_server(
 async def update_server(
     server_id: str,
     server_update: ServerCreate,
+    background_tasks: BackgroundTasks,
     current_user: dict = Depends(get_current_user)
 ):
     """Update server information"""
-    server = await db.get_server(server_id, current_user['id'])
-    if not server:
+    # Update server, then test the new connection after responding
+    update_data = server_update.dict()
+    update_data['connection_status'] = ConnectionStatus.PENDING.value
+    previous = await db.update_server(server_id, current_user['id'], update_data)
+    
+    if previous is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Server not found"
         )
     
-    # Test new connection
-    test_success = ssh_manager.test_connection(
-        host=server_update.host,
-        username=server_update.username,
-        port=server_update.port,
-        password=server_update.password if server_update.use_password else None,
-        ssh_key=server_update.ssh_key if not server_update.use_password else None
+    background_tasks.add_task(
+        verify_server_connection, server_id, current_user, server_update
     )
     
-    if not test_success:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Failed to connect with new credentials"
-        )
-    
-    # Update server
-    update_data = server_update.dict()
-    success = await db.update_server(server_id, current_user['id'], update_data)
-    
-    if not success:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to update server"
-        )
-    
-    return {"message": "Server updated successfully"}
+    return {
+        "message": "Server updated successfully",
+        "test_connection": ConnectionStatus.PENDING.value
+    }
 
 @app.delete("/api/servers/{server_id}")
 async def delete_server(
@@ -240,28 +247,19 @@ async def delete_server(
     current_user: dict = Depends(get_current_user)
 ):
     """Delete a server"""
-    server = await db.get_server(server_id, current_user['id'])
-    if not server:
+    server = await db.delete_server(server_id, current_user['id'])
+    
+    if server is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Server not found"
         )
     
-    success = await db.delete_server(server_id, current_user['id'])
-    
-    if not success:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to delete server"
-        )
-    
-    # Send email notification
-    asyncio.create_task(
-        email_service.send_server_notification(
-            current_user['email'],
-            server['name'],
-            "deleted"
-        )
+    # Queue email notification
+    await email_service.send_server_notification(
+        current_user['email'],
+        server['name'],
+        "deleted"
     )
     
     return {"message": "Server deleted successfully"}
@@ -277,25 +275,30 @@ async def execute_command(
 ):
     """Execute a command on a remote server"""
     # Get server details
-    server = await db.get_server(server_id, current_user['id'])
+    server = await db.get_server_with_credentials(server_id, current_user['id'])
     if not server:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Server not found"
         )
     
-    # Sanitize command
+    # Sanitize command, and normalize it once for every validation below
     command = validator.sanitize_command(command_request.command)
+    normalized = normalize_command(command)
     
     # Execute command
     try:
+        # Reject disallowed commands without starting the SSH coroutine
+        validator.precheck(command, normalized)
+
         output, error, exit_code, exec_time = await ssh_manager.execute_command(
             host=server['host'],
             username=server['username'],
             port=server['port'],
-            password=server.get('password') if server.get('use_password') else None,
+            password=db.reveal_password(server) if server.get('use_password') else None,
             ssh_key=server.get('ssh_key') if not server.get('use_password') else None,
-            command=command
+            command=command,
+            normalized=normalized
         )
         
         # Create log entry
@@ -314,14 +317,13 @@ async def execute_command(
         
         # Send email notification for failed commands
         if exit_code != 0:
-            asyncio.create_task(
-                email_service.send_command_notification(
-                    current_user['email'],
-                    server['name'],
-                    command,
-                    success=False,
-                    output=f"Error: {error}\nExit Code: {exit_code}"
-                )
+            await email_service.send_command_failure_notification(
+                current_user['email'],
+                current_user['id'],
+                server_id,
+                server['name'],
+                command,
+                output=f"Error: {error}\nExit Code: {exit_code}"
             )
         
         return {
@@ -338,15 +340,108 @@ async def execute_command(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
-    except Exception as e:
+    except RuntimeError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to execute command: {str(e)}"
         )
 
+@app.post("/api/servers/{server_id}/execute-batch")
+async def execute_batch(
+    server_id: str,
+    batch_request: BatchCommandRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Execute several commands in order on a remote server over one SSH channel"""
+    server = await db.get_server_with_credentials(server_id, current_user['id'])
+    if not server:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Server not found"
+        )
+    
+    commands = [validator.sanitize_command(command) for command in batch_request.commands]
+    normalized = [normalize_command(command) for command in commands]
+    
+    try:
+        for command, command_lower in zip(commands, normalized):
+            validator.precheck(command, command_lower)
+
+        results, exec_time = await ssh_manager.execute_batch(
+            host=server['host'],
+            username=server['username'],
+            port=server['port'],
+            password=db.reveal_password(server) if server.get('use_password') else None,
+            ssh_key=server.get('ssh_key') if not server.get('use_password') else None,
+            commands=commands,
+            normalized=normalized
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except BatchOutputError as e:
+        # The commands ran but their output couldn't be split; log it whole
+        await db.create_log({
+            "user_id": current_user['id'],
+            "server_id": server_id,
+            "server_name": server['name'],
+            "command": "\n".join(commands),
+            "output": e.output,
+            "error": e.error,
+            "exit_code": e.exit_code
+        })
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to execute commands: {str(e)}"
+        )
+    except RuntimeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to execute commands: {str(e)}"
+        )
+    
+    response = []
+    for command, (output, error, exit_code) in zip(commands, results):
+        # Commands in a batch share one channel, so each log records the batch time
+        await db.create_log({
+            "user_id": current_user['id'],
+            "server_id": server_id,
+            "server_name": server['name'],
+            "command": command,
+            "output": output,
+            "error": error,
+            "exit_code": exit_code,
+            "execution_time": exec_time
+        })
+        
+        if exit_code != 0:
+            await email_service.send_command_failure_notification(
+                current_user['email'],
+                current_user['id'],
+                server_id,
+                server['name'],
+                command,
+                output=f"Error: {error}\nExit Code: {exit_code}"
+            )
+        
+        response.append({
+            "command": command,
+            "output": output,
+            "error": error,
+            "exit_code": exit_code
+        })
+    
+    return {
+        "results": response,
+        "execution_time": exec_time,
+        "server": server['name']
+    }
+
 @app.get("/api/logs")
 async def get_logs(
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=settings.MAX_LOG_LIMIT),
     current_user: dict = Depends(get_current_user)
 ):
     """Get command execution logs for current user"""
@@ -380,9 +475,13 @@ async def health_check():
 # ========== RUN APPLICATION ==========
 
 if __name__ == "__main__":
+    # uvloop and httptools ship with uvicorn[standard] everywhere but Windows
+    fast_io = sys.platform != "win32"
     uvicorn.run(
         "app:app",
         host="0.0.0.0",
         port=8000,
-        reload=True
+        reload=settings.RELOAD,
+        loop="uvloop" if fast_io else "asyncio",
+        http="httptools" if fast_io else "h11"
     )
\ No newline at end of file
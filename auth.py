@@ -1,26 +1,45 @@
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
-import hashlib  # ADD THIS
+import jwt
+from jwt import InvalidTokenError
+import time
+import asyncio
+import functools
+import hashlib
+import hmac
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from models import Token, UserCreate
 from database import db
+from cache import cache, user_key
 from config import settings
 
-# REMOVE: pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
+password_hasher = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=1)
+ARGON2_PREFIX = "$argon2"
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    # Simple SHA256 hash (for demo only)
-    test_hash = hashlib.sha256(plain_password.encode()).hexdigest()
-    return test_hash == hashed_password
+    if not hashed_password.startswith(ARGON2_PREFIX):
+        # Unsalted SHA256 hashes stored before the move to Argon2
+        legacy_hash = hashlib.sha256(plain_password.encode()).hexdigest()
+        return hmac.compare_digest(legacy_hash, hashed_password)
+    try:
+        return password_hasher.verify(hashed_password, plain_password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Check if a hash is legacy SHA256 or uses outdated Argon2 parameters"""
+    if not hashed_password.startswith(ARGON2_PREFIX):
+        return True
+    return password_hasher.check_needs_rehash(hashed_password)
 
 def get_password_hash(password: str) -> str:
     """Hash a password"""
-    # Simple SHA256 hash (for demo only)
-    return hashlib.sha256(password.encode()).hexdigest()
+    return password_hasher.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token"""
@@ -34,13 +53,29 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
+@functools.lru_cache(maxsize=4096)
+def _decode_token(token: str) -> dict:
+    return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+
+def decode_access_token(token: str) -> dict:
+    """Verify a JWT, reusing the decoded payload for tokens seen before"""
+    payload = _decode_token(token)
+    # A cached payload skips PyJWT's own expiry check, so repeat it here
+    if payload.get("exp", 0) <= time.time():
+        raise jwt.ExpiredSignatureError("Signature has expired")
+    return payload
+
 async def authenticate_user(email: str, password: str):
     """Authenticate a user"""
     user = await db.get_user_by_email(email)
     if not user:
         return False
-    if not verify_password(password, user['hashed_password']):
+    # Argon2 is deliberately slow, so keep it off the event loop
+    if not await asyncio.to_thread(verify_password, password, user['hashed_password']):
         return False
+    if password_needs_rehash(user['hashed_password']):
+        new_hash = await asyncio.to_thread(get_password_hash, password)
+        await db.update_user(user['id'], {"hashed_password": new_hash})
     return user
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
@@ -53,16 +88,23 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     
     try:
         token = credentials.credentials
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = decode_access_token(token)
         user_id: str = payload.get("sub")
         if user_id is None:
             raise credentials_exception
-    except JWTError:
+    except InvalidTokenError:
         raise credentials_exception
     
+    cached = await cache.get(user_key(user_id))
+    if cached is not None:
+        return cached
+
     user = await db.get_user_by_id(user_id)
     if user is None:
         raise credentials_exception
+    # Only login needs the hash; keep it out of the cache (and Redis)
+    user.pop('hashed_password', None)
+    await cache.set(user_key(user_id), user, settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
     return user
 
 async def register_new_user(user_data: UserCreate):
@@ -77,7 +119,7 @@ async def register_new_user(user_data: UserCreate):
     
     # Create user object
     user_dict = user_data.dict()
-    user_dict['hashed_password'] = get_password_hash(user_data.password)
+    user_dict['hashed_password'] = await asyncio.to_thread(get_password_hash, user_data.password)
     del user_dict['password']
     
     # Save user to database
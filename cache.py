@@ -0,0 +1,181 @@
+import time
+import orjson
+import functools
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Tuple
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from config import settings
+
+def user_key(user_id: str) -> str:
+    return f"user:{user_id}"
+
+def servers_key(user_id: str) -> str:
+    return f"servers:user:{user_id}"
+
+def server_key(user_id: str, server_id: str) -> str:
+    return f"servers:user:{user_id}:{server_id}"
+
+class LocalCache:
+    """Bounded in-process LRU used when Redis is not configured"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: bytes, ttl: int):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def replace(self, key: str, value: bytes):
+        """Overwrite a live entry without extending its expiry"""
+        expires_at, _ = self._entries[key]
+        self._entries[key] = (expires_at, value)
+
+    def delete(self, *keys: str):
+        for key in keys:
+            self._entries.pop(key, None)
+
+class Cache:
+    """JSON cache backed by Redis, or by a per-process LocalCache when REDIS_URL is unset"""
+
+    def __init__(self):
+        self.url = settings.REDIS_URL
+        self._redis: Optional[Redis] = None
+        self._local = LocalCache(settings.LOCAL_CACHE_SIZE)
+
+    async def connect(self):
+        """Create the Redis client"""
+        if self.url:
+            self._redis = Redis.from_url(self.url)
+
+    async def close(self):
+        """Close the Redis client"""
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss"""
+        if self._redis is None:
+            cached = self._local.get(key)
+            return orjson.loads(cached) if cached is not None else None
+        try:
+            cached = await self._redis.get(key)
+        except RedisError as e:
+            print(f"Cache get failed: {str(e)}")
+            return None
+        return orjson.loads(cached) if cached is not None else None
+
+    async def set(self, key: str, value: Any, ttl: int):
+        """Cache value under key for ttl seconds"""
+        if self._redis is None:
+            # Other workers can't invalidate this process, so keep entries short-lived
+            self._local.set(key, orjson.dumps(value), min(ttl, settings.LOCAL_CACHE_TTL))
+            return
+        try:
+            await self._redis.setex(key, ttl, orjson.dumps(value))
+        except RedisError as e:
+            print(f"Cache set failed: {str(e)}")
+
+    async def delete(self, *keys: str):
+        """Drop keys from the cache"""
+        if not keys:
+            return
+        if self._redis is None:
+            self._local.delete(*keys)
+            return
+        try:
+            await self._redis.delete(*keys)
+        except RedisError as e:
+            print(f"Cache delete failed: {str(e)}")
+
+    def _local_incr(self, key: str, ttl: int) -> int:
+        cached = self._local.get(key)
+        count = (orjson.loads(cached) if cached is not None else 0) + 1
+        if cached is None:
+            self._local.set(key, orjson.dumps(count), ttl)
+        else:
+            self._local.replace(key, orjson.dumps(count))
+        return count
+
+    async def incr(self, key: str, ttl: int) -> int:
+        """Increment a counter that expires ttl seconds after it was created"""
+        if self._redis is None:
+            return self._local_incr(key, ttl)
+        try:
+            # Create the counter with its expiry first (NX keeps an existing one),
+            # then increment, in one transaction so it can't be left without a TTL
+            async with self._redis.pipeline(transaction=True) as pipe:
+                pipe.set(key, 0, ex=ttl, nx=True)
+                pipe.incr(key)
+                _, count = await pipe.execute()
+            return count
+        except RedisError as e:
+            # Keep throttling per process rather than letting every call through
+            print(f"Cache incr failed: {str(e)}")
+            return self._local_incr(key, ttl)
+
+    async def push(self, key: str, value: Any, ttl: int):
+        """Append value to the list stored under key"""
+        if self._redis is None:
+            cached = self._local.get(key)
+            items = orjson.loads(cached) if cached is not None else []
+            items.append(value)
+            self._local.set(key, orjson.dumps(items), ttl)
+            return
+        try:
+            async with self._redis.pipeline(transaction=True) as pipe:
+                pipe.rpush(key, orjson.dumps(value))
+                pipe.expire(key, ttl)
+                await pipe.execute()
+        except RedisError as e:
+            print(f"Cache push failed: {str(e)}")
+
+    async def pop_all(self, key: str) -> List[Any]:
+        """Remove and return every value pushed under key"""
+        if self._redis is None:
+            cached = self._local.get(key)
+            self._local.delete(key)
+            return orjson.loads(cached) if cached is not None else []
+        try:
+            async with self._redis.pipeline(transaction=True) as pipe:
+                pipe.lrange(key, 0, -1)
+                pipe.delete(key)
+                items, _ = await pipe.execute()
+        except RedisError as e:
+            print(f"Cache pop failed: {str(e)}")
+            return []
+        return [orjson.loads(item) for item in items]
+
+# Create a global cache instance
+cache = Cache()
+
+def cached(expire: int, key_builder: Callable[..., str]):
+    """Cache an async function's result under key_builder(*args, **kwargs)"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = key_builder(*args, **kwargs)
+            hit = await cache.get(key)
+            if hit is not None:
+                return hit
+            value = await func(*args, **kwargs)
+            if value is not None:
+                await cache.set(key, value, expire)
+            return value
+        return wrapper
+    return decorator
@@ -8,9 +8,24 @@ class Settings:
     SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
     ALGORITHM = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES = 30
+    # Key for stored server credentials (falls back to SECRET_KEY)
+    ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY", "")
+    
+    # Server
+    RELOAD = os.getenv("RELOAD", "false").lower() == "true"
+    THREAD_POOL_WORKERS = int(os.getenv("THREAD_POOL_WORKERS", 64))
     
     # SSH Settings
     SSH_TIMEOUT = 30
+    SSH_COMPRESSION = os.getenv("SSH_COMPRESSION", "true").lower() == "true"
+    # Refuse CBC ciphers, SHA-1/MD5 MACs and SHA-1 key exchange (very old servers may need these)
+    SSH_FAST_ALGOS = os.getenv("SSH_FAST_ALGOS", "false").lower() == "true"
+    SSH_POOL_IDLE_TIMEOUT = int(os.getenv("SSH_POOL_IDLE_TIMEOUT", 60))
+    SSH_POOL_MAX_IDLE = int(os.getenv("SSH_POOL_MAX_IDLE", 32))
+    # Concurrent channels per connection; OpenSSH's MaxSessions defaults to 10
+    SSH_MAX_SESSIONS = int(os.getenv("SSH_MAX_SESSIONS", 8))
+    # Commands accepted in one /execute-batch request
+    MAX_BATCH_COMMANDS = int(os.getenv("MAX_BATCH_COMMANDS", 20))
     ALLOWED_COMMANDS = [
         "ls", "pwd", "whoami", "date", "uptime", "free", "df", "ps",
         "cat", "grep", "tail", "head", "wc", "find", "du", "uname"
@@ -26,12 +41,24 @@ class Settings:
     EMAIL_USER = os.getenv("EMAIL_USER", "")
     EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD", "")
     EMAIL_FROM = os.getenv("EMAIL_FROM", "")
+    EMAIL_IDLE_TIMEOUT = int(os.getenv("EMAIL_IDLE_TIMEOUT", 60))
+    EMAIL_DIGEST_WINDOW = int(os.getenv("EMAIL_DIGEST_WINDOW", 300))
     
     # File paths
     DATA_DIR = "data"
-    USERS_FILE = os.path.join(DATA_DIR, "users.json")
-    SERVERS_FILE = os.path.join(DATA_DIR, "servers.json")
-    LOGS_FILE = os.path.join(DATA_DIR, "logs.json")
+    DATABASE_PATH = os.getenv("DATABASE_PATH", os.path.join(DATA_DIR, "app.db"))
+
+    # Database connection pool
+    DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 5))
+    DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 20))
+    MAX_LOG_LIMIT = 500
+    
+    # Cache
+    REDIS_URL = os.getenv("REDIS_URL", "")
+    SERVER_CACHE_TTL = int(os.getenv("SERVER_CACHE_TTL", 300))
+    # In-process fallback when REDIS_URL is unset
+    LOCAL_CACHE_SIZE = int(os.getenv("LOCAL_CACHE_SIZE", 1024))
+    LOCAL_CACHE_TTL = int(os.getenv("LOCAL_CACHE_TTL", 30))
     
     # Ensure data directory exists
     if not os.path.exists(DATA_DIR):
@@ -1,181 +1,417 @@
-import json
 import os
+import json
 import uuid
-from datetime import datetime
+import time
+from datetime import datetime, timezone
 from typing import Dict, List, Any, Optional
 from config import settings
-import aiofiles
+from encryption import cipher
+from cache import cache, cached, user_key, servers_key, server_key
+import aiosqlite
 from pathlib import Path
+from contextlib import asynccontextmanager
 import asyncio
 
-class JSONDatabase:
-    def __init__(self, data_dir="data"):
-        self.data_dir = data_dir
-        # This line is CRITICAL for Render
-        Path(self.data_dir).mkdir(parents=True, exist_ok=True)
-
-        self.users_file = os.path.join(data_dir, "users.json")
-        self.servers_file = os.path.join(data_dir, "servers.json")
-        self.logs_file = os.path.join(data_dir, "logs.json")
-        self._init_files()
-    
-    def _init_files(self):
-        """Initialize JSON files if they don't exist"""
-        for file_path in [self.users_file, self.servers_file, self.logs_file]:
-            if not os.path.exists(file_path):
-                with open(file_path, 'w') as f:
-                    json.dump([], f)
-    
-    async def _read_file(self, file_path: str) -> List[Dict]:
-        """Read JSON file asynchronously"""
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+
+USER_COLUMNS = (
+    "id", "email", "hashed_password", "first_name", "last_name", "age",
+    "phone", "profile_photo", "role", "created_at", "updated_at"
+)
+SERVER_COLUMNS = (
+    "id", "user_id", "name", "host", "username", "port", "use_password",
+    "password", "ssh_key", "connection_status", "created_at", "updated_at"
+)
+# Servers without their credentials; the only form that is ever cached
+SERVER_PUBLIC_COLUMNS = tuple(c for c in SERVER_COLUMNS if c not in ("password", "ssh_key"))
+LOG_COLUMNS = (
+    "id", "user_id", "server_id", "server_name", "command", "output",
+    "error", "exit_code", "execution_time", "timestamp"
+)
+# Stored as integer nanoseconds since the epoch (time.time_ns())
+TIMESTAMP_COLUMNS = ("created_at", "updated_at", "timestamp")
+
+# Files written by the old JSON storage, imported once into empty tables
+LEGACY_JSON_FILES = (
+    ("users", "users.json", USER_COLUMNS),
+    ("servers", "servers.json", SERVER_COLUMNS),
+    ("logs", "logs.json", LOG_COLUMNS),
+)
+
+def _iso_to_ns(value: Any) -> Any:
+    """Convert a legacy datetime.now().isoformat() string (local time) to epoch nanoseconds"""
+    if not isinstance(value, str):
+        return value
+    return round(datetime.fromisoformat(value).timestamp() * 1e6) * 1000
+
+def _row_to_dict(row: aiosqlite.Row) -> Dict:
+    """Convert a row, formatting stored timestamps as ISO 8601 for clients"""
+    data = dict(row)
+    for column in TIMESTAMP_COLUMNS:
+        value = data.get(column)
+        if isinstance(value, int):
+            data[column] = datetime.fromtimestamp(value / 1e9, tz=timezone.utc).isoformat()
+    return data
+
+class ConnectionPool:
+    """Pool of open aiosqlite connections shared across requests"""
+
+    def __init__(self, db_path: str, min_size: int = 5, max_size: int = 20):
+        self.db_path = db_path
+        self.min_size = min_size
+        self.max_size = max_size
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._size = 0
+
+    async def _connect(self) -> aiosqlite.Connection:
+        # Reserve the slot before awaiting so concurrent acquirers can't overshoot max_size
+        self._size += 1
         try:
-            async with aiofiles.open(file_path, 'r') as f:
-                content = await f.read()
-                return json.loads(content) if content else []
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
-    
-    async def _write_file(self, file_path: str, data: List[Dict]):
-        """Write to JSON file asynchronously"""
-        async with aiofiles.open(file_path, 'w') as f:
-            await f.write(json.dumps(data, indent=2, default=str))
-    
+            conn = await aiosqlite.connect(self.db_path)
+        except Exception:
+            self._size -= 1
+            raise
+        conn.row_factory = aiosqlite.Row
+        # WAL turns each insert (e.g. create_log) into an append to the write-ahead log;
+        # NORMAL skips the fsync of the main database file on every commit
+        await conn.execute("PRAGMA journal_mode=WAL")
+        await conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    async def open(self):
+        """Open the minimum number of connections up front"""
+        for _ in range(self.min_size):
+            self._idle.put_nowait(await self._connect())
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Borrow a connection, opening a new one if the pool isn't full"""
+        if self._idle.empty() and self._size < self.max_size:
+            conn = await self._connect()
+        else:
+            conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                await conn.rollback()
+            self._idle.put_nowait(conn)
+
+    async def close(self):
+        """Close all idle connections"""
+        while not self._idle.empty():
+            conn = self._idle.get_nowait()
+            await conn.close()
+            self._size -= 1
+
+class SQLiteDatabase:
+    def __init__(self, db_path: str = settings.DATABASE_PATH):
+        self.db_path = db_path
+        # This line is CRITICAL for Render
+        Path(os.path.dirname(self.db_path) or ".").mkdir(parents=True, exist_ok=True)
+        self._pool: Optional[ConnectionPool] = None
+        # SQLite allows one writer at a time; queue writers here instead of
+        # letting pooled connections contend for the file lock
+        self._write_lock = asyncio.Lock()
+
+    async def connect(self):
+        """Open the connection pool and apply the schema"""
+        self._pool = ConnectionPool(
+            self.db_path,
+            min_size=settings.DB_POOL_MIN_SIZE,
+            max_size=settings.DB_POOL_MAX_SIZE
+        )
+        await self._pool.open()
+        with open(SCHEMA_FILE) as f:
+            schema = f.read()
+        async with self._pool.acquire() as conn:
+            await conn.executescript(schema)
+            await conn.commit()
+            await self._import_legacy_json(conn)
+
+    async def _import_legacy_json(self, conn: aiosqlite.Connection):
+        """Copy rows from the old JSON files into empty tables, then set the files aside"""
+        for table, filename, columns in LEGACY_JSON_FILES:
+            path = os.path.join(settings.DATA_DIR, filename)
+            if not os.path.exists(path):
+                continue
+
+            # Every worker runs this at startup: take the write lock first, then
+            # recheck, so only one of them imports and the rest see it done
+            await conn.execute("BEGIN IMMEDIATE")
+            try:
+                async with conn.execute(f"SELECT 1 FROM {table} LIMIT 1") as cursor:
+                    populated = await cursor.fetchone() is not None
+                if populated or not os.path.exists(path):
+                    await conn.rollback()
+                    continue
+                try:
+                    with open(path) as f:
+                        content = f.read()
+                    records = json.loads(content) if content else []
+                except (OSError, json.JSONDecodeError) as e:
+                    print(f"Skipping legacy import of {path}: {str(e)}")
+                    await conn.rollback()
+                    continue
+
+                # Hashes and server passwords are copied as stored: auth and cipher
+                # read the old SHA-256/base64 forms and upgrade them on next login/update.
+                # Records are grouped by their fields so absent ones keep column defaults.
+                batches: Dict[tuple, List[tuple]] = {}
+                for record in records:
+                    row = self._filter(record, columns)
+                    for column in TIMESTAMP_COLUMNS:
+                        if column in row:
+                            row[column] = _iso_to_ns(row[column])
+                    batches.setdefault(tuple(row), []).append(tuple(row.values()))
+                for names, values in batches.items():
+                    placeholders = ", ".join("?" for _ in names)
+                    # OR IGNORE skips records missing required fields or duplicating a key
+                    await conn.executemany(
+                        f"INSERT OR IGNORE INTO {table} ({', '.join(names)}) VALUES ({placeholders})",
+                        values
+                    )
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+
+            try:
+                os.replace(path, path + ".imported")
+            except FileNotFoundError:
+                pass  # Another worker set it aside already
+            print(f"Imported {len(records)} {table} from {path}")
+
+    async def close(self):
+        """Close the connection pool"""
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    @staticmethod
+    def _filter(data: Dict, columns: tuple) -> Dict:
+        """Keep only keys that map to a table column"""
+        return {k: v for k, v in data.items() if k in columns}
+
+    @asynccontextmanager
+    async def _writer(self):
+        """Borrow a connection holding the write lock"""
+        async with self._write_lock:
+            async with self._pool.acquire() as conn:
+                yield conn
+
+    async def _insert(self, table: str, columns: tuple, data: Dict):
+        row = self._filter(data, columns)
+        names = ", ".join(row)
+        placeholders = ", ".join("?" for _ in row)
+        async with self._writer() as conn:
+            await conn.execute(
+                f"INSERT INTO {table} ({names}) VALUES ({placeholders})",
+                tuple(row.values())
+            )
+            await conn.commit()
+
+    async def _fetchone(self, query: str, params: tuple) -> Optional[Dict]:
+        async with self._pool.acquire() as conn:
+            async with conn.execute(query, params) as cursor:
+                row = await cursor.fetchone()
+        return _row_to_dict(row) if row else None
+
+    async def _fetchall(self, query: str, params: tuple) -> List[Dict]:
+        async with self._pool.acquire() as conn:
+            async with conn.execute(query, params) as cursor:
+                rows = await cursor.fetchall()
+        return [_row_to_dict(row) for row in rows]
+
+    async def _execute(self, query: str, params: tuple) -> int:
+        """Run a mutating statement and return the affected row count"""
+        async with self._writer() as conn:
+            cursor = await conn.execute(query, params)
+            await conn.commit()
+            return cursor.rowcount
+
     # User Operations
     async def create_user(self, user_data: Dict) -> str:
         """Create a new user"""
         user_data['id'] = str(uuid.uuid4())
-        user_data['created_at'] = datetime.now().isoformat()
+        user_data['created_at'] = time.time_ns()
         user_data['role'] = 'user'
-        
-        users = await self._read_file(self.users_file)
-        users.append(user_data)
-        await self._write_file(self.users_file, users)
-        
+
+        await self._insert("users", USER_COLUMNS, user_data)
+
         return user_data['id']
-    
+
     async def get_user_by_email(self, email: str) -> Optional[Dict]:
         """Get user by email"""
-        users = await self._read_file(self.users_file)
-        for user in users:
-            if user['email'] == email:
-                return user
-        return None
-    
+        return await self._fetchone(
+            "SELECT * FROM users WHERE email = ? LIMIT 1", (email,)
+        )
+
     async def get_user_by_id(self, user_id: str) -> Optional[Dict]:
         """Get user by ID"""
-        users = await self._read_file(self.users_file)
-        for user in users:
-            if user['id'] == user_id:
-                return user
-        return None
-    
-    async def update_user(self, user_id: str, update_data: Dict) -> bool:
-        """Update user information"""
-        users = await self._read_file(self.users_file)
-        for i, user in enumerate(users):
-            if user['id'] == user_id:
-                users[i].update(update_data)
-                users[i]['updated_at'] = datetime.now().isoformat()
-                await self._write_file(self.users_file, users)
-                return True
-        return False
-    
+        return await self._fetchone(
+            "SELECT * FROM users WHERE id = ? LIMIT 1", (user_id,)
+        )
+
+    async def update_user(self, user_id: str, update_data: Dict) -> Optional[Dict]:
+        """Update user information and return the updated user"""
+        changes = self._filter(update_data, USER_COLUMNS)
+        changes.pop('id', None)
+        changes['updated_at'] = time.time_ns()
+
+        assignments = ", ".join(f"{k} = ?" for k in changes)
+        async with self._writer() as conn:
+            cursor = await conn.execute(
+                f"UPDATE users SET {assignments} WHERE id = ?",
+                (*changes.values(), user_id)
+            )
+            user = None
+            if cursor.rowcount > 0:
+                async with conn.execute(
+                    "SELECT * FROM users WHERE id = ? LIMIT 1", (user_id,)
+                ) as select:
+                    user = _row_to_dict(await select.fetchone())
+            await conn.commit()
+        await cache.delete(user_key(user_id))
+        return user
+
     async def delete_user(self, user_id: str) -> bool:
         """Delete user"""
-        users = await self._read_file(self.users_file)
-        new_users = [u for u in users if u['id'] != user_id]
-        
-        if len(new_users) != len(users):
-            await self._write_file(self.users_file, new_users)
-            return True
-        return False
-    
+        count = await self._execute("DELETE FROM users WHERE id = ?", (user_id,))
+        await cache.delete(user_key(user_id))
+        return count > 0
+
     # Server Operations
+    @staticmethod
+    def _decode_server(server: Dict) -> Dict:
+        server['use_password'] = bool(server.get('use_password'))
+        return server
+
+    @staticmethod
+    def reveal_password(server: Dict) -> Optional[str]:
+        """Decrypt a server's stored password. Only call this right before connecting."""
+        if not server.get('password'):
+            return None
+        return cipher.decrypt(server['password'], server['id'])
+
     async def create_server(self, user_id: str, server_data: Dict) -> str:
         """Create a new server for user"""
         server_data['id'] = str(uuid.uuid4())
         server_data['user_id'] = user_id
-        server_data['created_at'] = datetime.now().isoformat()
-        server_data['updated_at'] = datetime.now().isoformat()
-        
-        # Encrypt sensitive data (simple base64 for demo, use proper encryption in production)
+        server_data['created_at'] = server_data['updated_at'] = time.time_ns()
+
+        # Encrypt sensitive data, bound to the server id
         if server_data.get('password'):
-            import base64
-            server_data['password'] = base64.b64encode(server_data['password'].encode()).decode()
-        
-        servers = await self._read_file(self.servers_file)
-        servers.append(server_data)
-        await self._write_file(self.servers_file, servers)
-        
+            server_data['password'] = cipher.encrypt(server_data['password'], server_data['id'])
+
+        await self._insert("servers", SERVER_COLUMNS, server_data)
+        await cache.delete(servers_key(user_id))
+
         return server_data['id']
-    
+
+    # Cached rows leave out password and ssh_key so credentials never reach Redis;
+    # the execute path reads them with get_server_with_credentials
+    @cached(
+        expire=settings.SERVER_CACHE_TTL,
+        key_builder=lambda self, user_id: servers_key(user_id)
+    )
+    async def _fetch_user_servers(self, user_id: str) -> List[Dict]:
+        return await self._fetchall(
+            f"SELECT {', '.join(SERVER_PUBLIC_COLUMNS)} FROM servers WHERE user_id = ?", (user_id,)
+        )
+
+    @cached(
+        expire=settings.SERVER_CACHE_TTL,
+        key_builder=lambda self, server_id, user_id: server_key(user_id, server_id)
+    )
+    async def _fetch_server(self, server_id: str, user_id: str) -> Optional[Dict]:
+        async with self._pool.acquire() as conn:
+            return await self._select_server(conn, server_id, user_id, SERVER_PUBLIC_COLUMNS)
+
+    @staticmethod
+    async def _select_server(
+        conn: aiosqlite.Connection,
+        server_id: str,
+        user_id: str,
+        columns: tuple = SERVER_COLUMNS
+    ) -> Optional[Dict]:
+        async with conn.execute(
+            f"SELECT {', '.join(columns)} FROM servers WHERE user_id = ? AND id = ? LIMIT 1",
+            (user_id, server_id)
+        ) as cursor:
+            row = await cursor.fetchone()
+        return _row_to_dict(row) if row else None
+
     async def get_user_servers(self, user_id: str) -> List[Dict]:
-        """Get all servers for a user"""
-        servers = await self._read_file(self.servers_file)
-        user_servers = [s for s in servers if s['user_id'] == user_id]
-        
-        # Decrypt passwords
-        for server in user_servers:
-            if server.get('password'):
-                import base64
-                server['password'] = base64.b64decode(server['password'].encode()).decode()
-        
-        return user_servers
-    
+        """Get all servers for a user, without credentials"""
+        servers = await self._fetch_user_servers(user_id)
+        return [self._decode_server(server) for server in servers]
+
     async def get_server(self, server_id: str, user_id: str) -> Optional[Dict]:
-        """Get a specific server"""
-        servers = await self._read_file(self.servers_file)
-        for server in servers:
-            if server['id'] == server_id and server['user_id'] == user_id:
-                if server.get('password'):
-                    import base64
-                    server['password'] = base64.b64decode(server['password'].encode()).decode()
-                return server
-        return None
-    
-    async def update_server(self, server_id: str, user_id: str, update_data: Dict) -> bool:
-        """Update server information"""
-        servers = await self._read_file(self.servers_file)
-        for i, server in enumerate(servers):
-            if server['id'] == server_id and server['user_id'] == user_id:
-                # Encrypt password if updating
-                if update_data.get('password'):
-                    import base64
-                    update_data['password'] = base64.b64encode(update_data['password'].encode()).decode()
-                
-                servers[i].update(update_data)
-                servers[i]['updated_at'] = datetime.now().isoformat()
-                await self._write_file(self.servers_file, servers)
-                return True
-        return False
-    
-    async def delete_server(self, server_id: str, user_id: str) -> bool:
-        """Delete a server"""
-        servers = await self._read_file(self.servers_file)
-        new_servers = [s for s in servers if not (s['id'] == server_id and s['user_id'] == user_id)]
-        
-        if len(new_servers) != len(servers):
-            await self._write_file(self.servers_file, new_servers)
-            return True
-        return False
-    
+        """Get a specific server, without credentials"""
+        server = await self._fetch_server(server_id, user_id)
+        return self._decode_server(server) if server else None
+
+    async def get_server_with_credentials(self, server_id: str, user_id: str) -> Optional[Dict]:
+        """Get a server including its stored password and SSH key (never cached)"""
+        async with self._pool.acquire() as conn:
+            server = await self._select_server(conn, server_id, user_id)
+        return self._decode_server(server) if server else None
+
+    async def update_server(self, server_id: str, user_id: str, update_data: Dict) -> Optional[Dict]:
+        """Update server information and return the server as it was before, or None if not found"""
+        changes = self._filter(update_data, SERVER_COLUMNS)
+        for key in ('id', 'user_id', 'created_at'):
+            changes.pop(key, None)
+
+        # Encrypt password if updating
+        if changes.get('password'):
+            changes['password'] = cipher.encrypt(changes['password'], server_id)
+        changes['updated_at'] = time.time_ns()
+
+        assignments = ", ".join(f"{k} = ?" for k in changes)
+        async with self._writer() as conn:
+            previous = await self._select_server(conn, server_id, user_id)
+            if previous is None:
+                return None
+            await conn.execute(
+                f"UPDATE servers SET {assignments} WHERE user_id = ? AND id = ?",
+                (*changes.values(), user_id, server_id)
+            )
+            await conn.commit()
+        await cache.delete(servers_key(user_id), server_key(user_id, server_id))
+        return self._decode_server(previous)
+
+    async def delete_server(self, server_id: str, user_id: str) -> Optional[Dict]:
+        """Delete a server and return it, or None if not found"""
+        async with self._writer() as conn:
+            previous = await self._select_server(conn, server_id, user_id)
+            if previous is None:
+                return None
+            await conn.execute(
+                "DELETE FROM servers WHERE user_id = ? AND id = ?",
+                (user_id, server_id)
+            )
+            await conn.commit()
+        await cache.delete(servers_key(user_id), server_key(user_id, server_id))
+        return self._decode_server(previous)
+
     # Log Operations
     async def create_log(self, log_data: Dict) -> str:
         """Create a command execution log"""
         log_data['id'] = str(uuid.uuid4())
-        log_data['timestamp'] = datetime.now().isoformat()
-        
-        logs = await self._read_file(self.logs_file)
-        logs.append(log_data)
-        await self._write_file(self.logs_file, logs)
-        
+        log_data['timestamp'] = time.time_ns()
+
+        await self._insert("logs", LOG_COLUMNS, log_data)
+
         return log_data['id']
-    
+
     async def get_user_logs(self, user_id: str, limit: int = 50) -> List[Dict]:
         """Get logs for a user"""
-        logs = await self._read_file(self.logs_file)
-        user_logs = [log for log in logs if log['user_id'] == user_id]
-        return sorted(user_logs, key=lambda x: x['timestamp'], reverse=True)[:limit]
+        return await self._fetchall(
+            "SELECT * FROM logs WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?",
+            (user_id, limit)
+        )
 
 # Create a global database instance
-db = JSONDatabase()
\ No newline at end of file
+db = SQLiteDatabase()
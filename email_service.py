@@ -1,8 +1,10 @@
 import asyncio
+from typing import Optional, Set
 from aiosmtplib import SMTP
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from config import settings
+from cache import cache
 
 class EmailService:
     def __init__(self):
@@ -11,37 +13,104 @@ class EmailService:
         self.username = settings.EMAIL_USER
         self.password = settings.EMAIL_PASSWORD
         self.from_email = settings.EMAIL_FROM or settings.EMAIL_USER
+        self.idle_timeout = settings.EMAIL_IDLE_TIMEOUT
+        self.digest_window = settings.EMAIL_DIGEST_WINDOW
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+        self._digests: Set[asyncio.Task] = set()
+    
+    async def start(self):
+        """Start the background sender that drains the email queue"""
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._consume())
+    
+    async def stop(self):
+        """Flush queued emails (briefly) and stop the background sender"""
+        for task in self._digests:
+            task.cancel()
+        if self._worker is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=5)
+        except asyncio.TimeoutError:
+            print(f"Dropping {self._queue.qsize()} queued emails on shutdown")
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+    
+    async def _connect(self) -> SMTP:
+        smtp = SMTP(hostname=self.host, port=self.port, start_tls=True)
+        await smtp.connect()
+        await smtp.login(self.username, self.password)
+        return smtp
+    
+    @staticmethod
+    async def _disconnect(smtp: Optional[SMTP]):
+        if smtp is None:
+            return
+        try:
+            await smtp.quit()
+        except Exception:
+            smtp.close()
+    
+    async def _consume(self):
+        """Send queued messages over one SMTP connection, reconnecting as needed"""
+        smtp = None
+        try:
+            while True:
+                try:
+                    # Hang up an idle connection rather than let the server drop it
+                    message = await asyncio.wait_for(
+                        self._queue.get(),
+                        timeout=self.idle_timeout if smtp else None
+                    )
+                except asyncio.TimeoutError:
+                    await self._disconnect(smtp)
+                    smtp = None
+                    continue
+                
+                try:
+                    # A second attempt covers connections the server closed while idle
+                    for attempt in range(2):
+                        try:
+                            if smtp is None:
+                                smtp = await self._connect()
+                            await smtp.send_message(message)
+                            print(f"Email sent to {message['To']}")
+                            break
+                        except Exception as e:
+                            await self._disconnect(smtp)
+                            smtp = None
+                            if attempt == 1:
+                                print(f"Failed to send email: {str(e)}")
+                finally:
+                    self._queue.task_done()
+        finally:
+            await self._disconnect(smtp)
     
     async def send_email(self, to_email: str, subject: str, body: str, html_body: str = None):
-        """Send an email"""
+        """Queue an email for the background sender"""
         if not all([self.host, self.port, self.username, self.password]):
             print("Email configuration missing. Skipping email send.")
             return False
         
-        try:
-            message = MIMEMultipart('alternative')
-            message['From'] = self.from_email
-            message['To'] = to_email
-            message['Subject'] = subject
-            
-            # Add plain text version
-            message.attach(MIMEText(body, 'plain'))
-            
-            # Add HTML version if provided
-            if html_body:
-                message.attach(MIMEText(html_body, 'html'))
-            
-            # Send email
-            async with SMTP(hostname=self.host, port=self.port, start_tls=True) as smtp:
-                await smtp.login(self.username, self.password)
-                await smtp.send_message(message)
-            
-            print(f"Email sent to {to_email}")
-            return True
-            
-        except Exception as e:
-            print(f"Failed to send email: {str(e)}")
-            return False
+        message = MIMEMultipart('alternative')
+        message['From'] = self.from_email
+        message['To'] = to_email
+        message['Subject'] = subject
+        
+        # Add plain text version
+        message.attach(MIMEText(body, 'plain'))
+        
+        # Add HTML version if provided
+        if html_body:
+            message.attach(MIMEText(html_body, 'html'))
+        
+        await self._queue.put(message)
+        return True
     
     async def send_command_notification(self, user_email: str, server_name: str, command: str, 
                                       success: bool, output: str = ""):
@@ -80,6 +149,50 @@ class EmailService:
         
         await self.send_email(user_email, subject, body, html_body)
     
+    async def send_command_failure_notification(self, user_email: str, user_id: str,
+                                                server_id: str, server_name: str,
+                                                command: str, output: str = ""):
+        """Report a failed command, folding repeats within the digest window into one email"""
+        throttle_key = f"mail:{user_id}:{server_id}"
+        digest_key = f"mail:digest:{user_id}:{server_id}"
+        
+        # INCR is atomic in Redis, so only one worker sends the first email per window
+        count = await cache.incr(throttle_key, self.digest_window)
+        if count > 1:
+            await cache.push(digest_key, {"command": command, "output": output[:200]},
+                             self.digest_window * 2)
+            return
+        
+        await self.send_command_notification(user_email, server_name, command,
+                                             success=False, output=output)
+        task = asyncio.create_task(self._send_failure_digest(user_email, server_name, digest_key))
+        self._digests.add(task)
+        task.add_done_callback(self._digests.discard)
+    
+    async def _send_failure_digest(self, user_email: str, server_name: str, digest_key: str):
+        """Email the failures suppressed during the digest window, if any"""
+        await asyncio.sleep(self.digest_window)
+        failures = await cache.pop_all(digest_key)
+        if not failures:
+            return
+        
+        subject = f"SSH Command FAILED on {server_name} ({len(failures)} more)"
+        lines = "\n".join(f"        - {f['command']}: {f['output']}" for f in failures)
+        
+        body = f"""
+        Command Failure Digest
+        
+        Server: {server_name}
+        Further failed commands in the last {self.digest_window // 60} minutes:
+        
+{lines}
+        
+        ---
+        Remote Server Manager
+        """
+        
+        await self.send_email(user_email, subject, body)
+    
     async def send_server_notification(self, user_email: str, server_name: str, action: str):
         """Send notification about server changes"""
         subject = f"Server {action}: {server_name}"
@@ -98,5 +211,23 @@ class EmailService:
         
         await self.send_email(user_email, subject, body)
 
+    async def send_connection_failed_notification(self, user_email: str, server_name: str):
+        """Send notification when a saved server fails its connection test"""
+        subject = f"Server connection failed: {server_name}"
+        
+        body = f"""
+        Server Connection Notification
+        
+        Server: {server_name}
+        
+        We could not connect to this server with the saved credentials.
+        Please check the host, port and credentials.
+        
+        ---
+        Remote Server Manager
+        """
+        
+        await self.send_email(user_email, subject, body)
+
 # Create email service instance
 email_service = EmailService()
\ No newline at end of file
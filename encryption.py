@@ -0,0 +1,39 @@
+import os
+import base64
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from config import settings
+
+class CredentialCipher:
+    """AES-GCM encryption for stored server credentials"""
+
+    PREFIX = "v1:"
+    NONCE_SIZE = 12
+
+    def __init__(self, secret: str):
+        key = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=None,
+            info=b"remote-server-manager credentials"
+        ).derive(secret.encode())
+        self._aesgcm = AESGCM(key)
+
+    def encrypt(self, plaintext: str, associated_data: str) -> str:
+        """Encrypt plaintext, binding it to associated_data (e.g. the server id)"""
+        nonce = os.urandom(self.NONCE_SIZE)
+        ciphertext = self._aesgcm.encrypt(nonce, plaintext.encode(), associated_data.encode())
+        return self.PREFIX + base64.b64encode(nonce + ciphertext).decode()
+
+    def decrypt(self, token: str, associated_data: str) -> str:
+        """Decrypt a value produced by encrypt"""
+        if not token.startswith(self.PREFIX):
+            # Plain base64 values stored before AES-GCM was introduced
+            return base64.b64decode(token.encode()).decode()
+        raw = base64.b64decode(token[len(self.PREFIX):])
+        nonce, ciphertext = raw[:self.NONCE_SIZE], raw[self.NONCE_SIZE:]
+        return self._aesgcm.decrypt(nonce, ciphertext, associated_data.encode()).decode()
+
+# Create cipher instance
+cipher = CredentialCipher(settings.ENCRYPTION_KEY or settings.SECRET_KEY)
@@ -0,0 +1,9 @@
+import os
+import multiprocessing
+
+# Run with: gunicorn -c gunicorn.conf.py app:app
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# UvicornWorker picks uvloop and httptools automatically when installed
+worker_class = "uvicorn.workers.UvicornWorker"
+worker_connections = 1000
@@ -2,11 +2,17 @@ from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List
 from datetime import datetime
 from enum import Enum
+from config import settings
 
 class UserRole(str, Enum):
     USER = "user"
     ADMIN = "admin"
 
+class ConnectionStatus(str, Enum):
+    PENDING = "pending"
+    OK = "ok"
+    FAILED = "failed"
+
 # Request Models
 class UserCreate(BaseModel):
     email: EmailStr
@@ -36,6 +42,9 @@ class CommandRequest(BaseModel):
     command: str
     server_id: str
 
+class BatchCommandRequest(BaseModel):
+    commands: List[str] = Field(..., min_length=1, max_length=settings.MAX_BATCH_COMMANDS)
+
 # Response Models
 class UserResponse(BaseModel):
     id: str
@@ -54,6 +63,7 @@ class ServerResponse(BaseModel):
     host: str
     username: str
     port: int
+    connection_status: Optional[ConnectionStatus] = None
     created_at: datetime
     updated_at: datetime
 
@@ -0,0 +1,46 @@
+-- SQLite schema for Remote Server Manager
+
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    email TEXT NOT NULL,
+    hashed_password TEXT NOT NULL,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    age INTEGER,
+    phone TEXT,
+    profile_photo TEXT,
+    role TEXT NOT NULL DEFAULT 'user',
+    created_at INTEGER NOT NULL,
+    updated_at INTEGER
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email ON users(email);
+
+CREATE TABLE IF NOT EXISTS servers (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    host TEXT NOT NULL,
+    username TEXT NOT NULL,
+    port INTEGER NOT NULL DEFAULT 22,
+    use_password INTEGER NOT NULL DEFAULT 0,
+    password TEXT,
+    ssh_key TEXT,
+    connection_status TEXT NOT NULL DEFAULT 'pending',
+    created_at INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_servers_user_id ON servers(user_id, id);
+
+CREATE TABLE IF NOT EXISTS logs (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    server_id TEXT NOT NULL,
+    server_name TEXT,
+    command TEXT NOT NULL,
+    output TEXT,
+    error TEXT,
+    exit_code INTEGER,
+    execution_time REAL,
+    timestamp INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_logs_user_timestamp ON logs(user_id, timestamp DESC);
@@ -1,54 +1,121 @@
 import re
+import functools
+from typing import Optional
 from config import settings
 
+try:
+    import ahocorasick
+except ImportError:  # pyahocorasick is a C extension and may be unavailable
+    ahocorasick = None
+
+try:
+    import re2
+except ImportError:  # google-re2 is optional; stdlib re compiles the same patterns
+    re2 = None
+
+# Commands are matched lower-cased, so lower-case the blocklist to match.
+# Snapshotted at import: changes to settings need a reimport.
+_BLOCKED = tuple(b.lower() for b in settings.BLOCKED_COMMANDS)
+
+# Match every blocked command in one pass over the input
+if ahocorasick is not None:
+    _BLOCK_AC = ahocorasick.Automaton()
+    for _blocked in _BLOCKED:
+        _BLOCK_AC.add_word(_blocked, _blocked)
+    _BLOCK_AC.make_automaton()
+
+    def _contains_blocked(command: str) -> bool:
+        return next(_BLOCK_AC.iter(command), None) is not None
+else:
+    _BLOCK_RE = re.compile("|".join(map(re.escape, _BLOCKED)))
+
+    def _contains_blocked(command: str) -> bool:
+        return _BLOCK_RE.search(command) is not None
+
+# Compiled once at import instead of on every call
+_DANGEROUS_PATTERNS = (
+    r"rm\s+.*-.*[rf]",  # rm with -r or -f flags
+    r":\(\)\{.*;\s*:",  # Fork bomb
+    r"chmod\s+[0-7]{3,4}\s+.*",  # chmod with 3-4 digit mode
+    r">\s*/dev/sd[a-z]",  # Writing to disk devices
+    r"dd\s+.*if=.*of=",  # dd command
+    r"mkfs\s+",  # Format commands
+    r">\s*/proc/",  # Writing to /proc
+)
+# One alternation scans the command once instead of once per pattern.
+# RE2 runs it in linear time, so crafted input can't make the .* terms backtrack.
+# RE2's \s is ASCII-only, so commands are scanned with whitespace collapsed to
+# single spaces; both engines then give the same verdict.
+_DANGER_RE = (re2 or re).compile("|".join(f"(?:{p})" for p in _DANGEROUS_PATTERNS))
+# Checked with a single str.startswith call
+_ALLOWED_PREFIXES = (
+    "ls", "pwd", "whoami", "date", "uptime",
+    "free", "df", "ps", "cat ", "grep ", "tail ",
+    "head ", "wc ", "find ", "du ", "uname", "echo ",
+    "cd ", "mkdir ", "touch ", "cp ", "mv "
+)
+# Allowed prefixes grouped by first character. A command whose first
+# character starts no allowed prefix is rejected before any scanning.
+_FIRST_CHAR = {}
+for _prefix in _ALLOWED_PREFIXES:
+    _FIRST_CHAR.setdefault(_prefix[0], []).append(_prefix)
+_FIRST_CHAR = {char: tuple(prefixes) for char, prefixes in _FIRST_CHAR.items()}
+
+_DANGER_CHARS = str.maketrans('', '', ';&|`$<>')
+
+def normalize_command(command: str) -> str:
+    """Trim and lower-case a command in one pass, the form validation works on"""
+    return command.strip().lower()
+
+@functools.lru_cache(maxsize=2048)
+def _is_normalized_command_allowed(command_lower: str) -> bool:
+    """Validate an already-normalized command. Verdicts are memoized."""
+    candidates = _FIRST_CHAR.get(command_lower[:1])
+    if candidates is None:
+        return False
+    
+    # Check for blocked commands
+    if _contains_blocked(command_lower):
+        return False
+    
+    # Check for dangerous patterns
+    if _DANGER_RE.search(" ".join(command_lower.split())):
+        return False
+    
+    # Allow only basic commands for demo
+    # In production, implement a whitelist system
+    return command_lower.startswith(candidates)
+
+def is_command_allowed(command: str, normalized: Optional[str] = None) -> bool:
+    """Check if command is allowed, reusing normalize_command(command) if the caller has it"""
+    if normalized is None:
+        normalized = normalize_command(command)
+    return _is_normalized_command_allowed(normalized)
+
 class CommandValidator:
     @staticmethod
-    def is_command_allowed(command: str) -> bool:
+    def is_command_allowed(command: str, normalized: Optional[str] = None) -> bool:
         """Check if command is allowed"""
-        command_lower = command.lower().strip()
-        
-        # Check for blocked commands
-        for blocked in settings.BLOCKED_COMMANDS:
-            if blocked in command_lower:
-                return False
-        
-        # Check for dangerous patterns
-        dangerous_patterns = [
-            r"rm\s+.*-.*[rf]",  # rm with -r or -f flags
-            r":\(\)\{.*;\s*:",  # Fork bomb
-            r"chmod\s+[0-7]{3,4}\s+.*",  # chmod with 3-4 digit mode
-            r">\s*/dev/sd[a-z]",  # Writing to disk devices
-            r"dd\s+.*if=.*of=",  # dd command
-            r"mkfs\s+",  # Format commands
-            r">\s*/proc/",  # Writing to /proc
-        ]
-        
-        for pattern in dangerous_patterns:
-            if re.search(pattern, command_lower):
-                return False
-        
-        # Allow only basic commands for demo
-        # In production, implement a whitelist system
-        allowed_prefixes = [
-            "ls", "pwd", "whoami", "date", "uptime", 
-            "free", "df", "ps", "cat ", "grep ", "tail ",
-            "head ", "wc ", "find ", "du ", "uname", "echo ",
-            "cd ", "mkdir ", "touch ", "cp ", "mv "
-        ]
-        
-        for prefix in allowed_prefixes:
-            if command_lower.startswith(prefix):
-                return True
-        
-        return False
+        return is_command_allowed(command, normalized)
+    
+    @staticmethod
+    def precheck(command: str, normalized: Optional[str] = None) -> None:
+        """Raise ValueError for a disallowed command, before any SSH work is scheduled"""
+        if not is_command_allowed(command, normalized):
+            raise ValueError(f"Command not allowed: {command}")
+    
+    @staticmethod
+    def cache_clear():
+        """Forget memoized verdicts, e.g. after the rules change"""
+        _is_normalized_command_allowed.cache_clear()
     
     @staticmethod
     def sanitize_command(command: str) -> str:
         """Sanitize command input"""
         # Remove multiple spaces
-        command = re.sub(r'\s+', ' ', command.strip())
+        command = " ".join(command.split())
         # Remove dangerous characters
-        command = re.sub(r'[;&|`$<>]', '', command)
+        command = command.translate(_DANGER_CHARS)
         return command
 
 # Create validator instance
@@ -1,85 +1,493 @@
 import paramiko
 import asyncio
-import time
+import re
+import shlex
+import uuid
+import hashlib
+from time import monotonic as _mono
+import select
+import socket
+import threading
+from collections import OrderedDict
 from io import StringIO
-from typing import Tuple
+from typing import Dict, List, Optional, Tuple
 from config import settings
 from security import validator
 
+# Older algorithms to skip when SSH_FAST_ALGOS is on, leaving paramiko to
+# negotiate AEAD/CTR ciphers, SHA-2 ETM MACs and curve25519/ECDH key exchange
+_SLOW_ALGORITHMS = {
+    "ciphers": ["3des-cbc", "aes128-cbc", "aes192-cbc", "aes256-cbc", "blowfish-cbc"],
+    "macs": ["hmac-sha1", "hmac-sha1-96", "hmac-md5", "hmac-md5-96"],
+    "kex": [
+        "diffie-hellman-group1-sha1",
+        "diffie-hellman-group14-sha1",
+        "diffie-hellman-group-exchange-sha1",
+    ],
+}
+
+def _decode(raw: bytes) -> str:
+    """Decode command output, taking the plain ASCII decoder when it applies"""
+    return raw.decode('ascii') if raw.isascii() else raw.decode('utf-8', errors='ignore')
+
+# Parsed keys by SHA-256 of the key text, least recently used first.
+# Keyed by digest so the cache doesn't also hold every PEM string.
+_KEY_CACHE: "OrderedDict[bytes, paramiko.PKey]" = OrderedDict()
+_KEY_CACHE_SIZE = 64
+_key_cache_lock = threading.Lock()
+
+def _load_pkey(ssh_key: str) -> paramiko.PKey:
+    """Return the parsed private key, parsing each distinct key text only once"""
+    digest = hashlib.sha256(ssh_key.encode()).digest()
+    with _key_cache_lock:
+        pkey = _KEY_CACHE.get(digest)
+        if pkey is not None:
+            _KEY_CACHE.move_to_end(digest)
+            return pkey
+
+    pkey = _parse_pkey(ssh_key)
+    with _key_cache_lock:
+        _KEY_CACHE[digest] = pkey
+        while len(_KEY_CACHE) > _KEY_CACHE_SIZE:
+            _KEY_CACHE.popitem(last=False)
+    return pkey
+
+def _parse_pkey(ssh_key: str) -> paramiko.PKey:
+    """Parse a PEM/OpenSSH private key of any supported type"""
+    for key_class in (paramiko.Ed25519Key, paramiko.ECDSAKey, paramiko.RSAKey):
+        try:
+            return key_class.from_private_key(StringIO(ssh_key))
+        except paramiko.SSHException:
+            continue
+    raise paramiko.SSHException("Unsupported or invalid private key")
+
+class BatchOutputError(RuntimeError):
+    """Batch output that couldn't be split per command; keeps the raw streams for logging"""
+
+    def __init__(self, output: str, error: str, exit_code: int):
+        super().__init__("Could not parse batch output")
+        self.output = output
+        self.error = error
+        self.exit_code = exit_code
+
+class PooledConnection:
+    """An SSH connection whose transport is shared by concurrent commands"""
+
+    def __init__(self, client: paramiko.SSHClient):
+        self.client = client
+        self.in_use = 1
+        self.last_used = _mono()
+        # Set once no new commands should use it; closed when the last one finishes
+        self.retired = False
+
 class SSHManager:
+    def __init__(self):
+        self.idle_timeout = settings.SSH_POOL_IDLE_TIMEOUT
+        self.max_idle = settings.SSH_POOL_MAX_IDLE
+        self.max_sessions = settings.SSH_MAX_SESSIONS
+        # Connections per (host, username, port, credentials digest),
+        # least recently used key first
+        self._pool: "OrderedDict[tuple, List[PooledConnection]]" = OrderedDict()
+        # Connects in progress per key, for concurrent callers to wait on
+        self._connecting: Dict[tuple, asyncio.Future] = {}
+        self._lock = asyncio.Lock()
+        self._reaper: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start the task that closes idle pooled connections"""
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap())
+
+    async def stop(self):
+        """Stop the reaper and close every pooled connection"""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+            self._reaper = None
+        async with self._lock:
+            for conns in self._pool.values():
+                for conn in conns:
+                    conn.client.close()
+            self._pool.clear()
+
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(max(self.idle_timeout / 2, 1))
+            async with self._lock:
+                self._evict_idle()
+
     @staticmethod
-    async def execute_command(
+    def _pool_key(host: str, username: str, port: int, password: str, ssh_key: str) -> tuple:
+        # Include the credentials so different logins never share a connection
+        secret = hashlib.sha256(f"{password or ''}\0{ssh_key or ''}".encode()).hexdigest()
+        return (host, username, port, secret)
+
+    @staticmethod
+    def _connect(
         host: str,
         username: str,
-        port: int = 22,
+        port: int,
         password: str = None,
         ssh_key: str = None,
-        command: str = ""
-    ) -> Tuple[str, str, int, float]:
-        """
-        Execute a command on remote server via SSH
-        
-        Returns: (output, error, exit_code, execution_time)
-        """
-        start_time = time.time()
-        client = None
-        
+        timeout: int = settings.SSH_TIMEOUT
+    ) -> paramiko.SSHClient:
+        """Open and authenticate a new SSH connection"""
+        if not ssh_key and not password:
+            raise ValueError("Either password or SSH key must be provided")
+
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        options = {
+            "compress": settings.SSH_COMPRESSION,
+            "disabled_algorithms": _SLOW_ALGORITHMS if settings.SSH_FAST_ALGOS else None
+        }
+
         try:
-            # Validate command
-            if not validator.is_command_allowed(command):
-                raise ValueError(f"Command not allowed: {command}")
-            
-            # Create SSH client
-            client = paramiko.SSHClient()
-            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            # Connect to server
             if ssh_key:
                 # Use SSH key
-                key_file = StringIO(ssh_key)
-                private_key = paramiko.RSAKey.from_private_key(key_file)
+                private_key = _load_pkey(ssh_key)
                 client.connect(
                     hostname=host,
                     username=username,
                     pkey=private_key,
                     port=port,
-                    timeout=settings.SSH_TIMEOUT
+                    timeout=timeout,
+                    **options
                 )
-            elif password:
+            else:
                 # Use password
                 client.connect(
                     hostname=host,
                     username=username,
                     password=password,
                     port=port,
-                    timeout=settings.SSH_TIMEOUT
+                    timeout=timeout,
+                    **options
                 )
+        except Exception:
+            client.close()
+            raise
+
+        return client
+
+    @staticmethod
+    def _is_alive(client: paramiko.SSHClient) -> bool:
+        transport = client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def _remove(self, key: tuple, conn: PooledConnection):
+        """Drop a connection from the pool and close it (lock held)"""
+        conns = self._pool.get(key, [])
+        if conn in conns:
+            conns.remove(conn)
+            if not conns:
+                del self._pool[key]
+        conn.client.close()
+
+    def _evict_idle(self):
+        """Close unused connections that are past the idle timeout or dead (lock held)"""
+        cutoff = _mono() - self.idle_timeout
+        for key, conns in list(self._pool.items()):
+            for conn in list(conns):
+                if conn.in_use == 0 and (conn.last_used < cutoff or not self._is_alive(conn.client)):
+                    self._remove(key, conn)
+
+    def _enforce_max_idle(self):
+        """Close least recently used unused connections beyond max_idle (lock held)"""
+        idle = [(key, conn) for key, conns in self._pool.items() for conn in conns if conn.in_use == 0]
+        for key, conn in idle[:max(len(idle) - self.max_idle, 0)]:
+            self._remove(key, conn)
+
+    async def _acquire(
+        self,
+        key: tuple,
+        host: str,
+        username: str,
+        port: int,
+        password: str = None,
+        ssh_key: str = None,
+        reuse: bool = True
+    ) -> Tuple[PooledConnection, bool]:
+        """
+        Share a live pooled connection with free session slots, or open a new one.
+        Concurrent callers for the same key wait on one in-flight connect.
+
+        Returns: (connection, whether it was reused from the pool)
+        """
+        while True:
+            async with self._lock:
+                pending = None
+                if reuse:
+                    for conn in list(self._pool.get(key, [])):
+                        if not self._is_alive(conn.client):
+                            if conn.in_use == 0:
+                                self._remove(key, conn)
+                            continue
+                        if conn.in_use < self.max_sessions:
+                            conn.in_use += 1
+                            self._pool.move_to_end(key)
+                            return conn, True
+                    pending = self._connecting.get(key)
+                if pending is None:
+                    connecting = asyncio.get_running_loop().create_future()
+                    self._connecting.setdefault(key, connecting)
+                    break
+
+            # Another caller is already connecting; share its connection once it's up
+            try:
+                await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # That caller was cancelled; try again
+            # Any other exception is that connect's failure, raised to every waiter
+
+        # Connect outside the lock so one slow host doesn't stall the others
+        try:
+            client = await asyncio.to_thread(self._connect, host, username, port, password, ssh_key)
+        except BaseException as e:
+            async with self._lock:
+                if self._connecting.get(key) is connecting:
+                    del self._connecting[key]
+            if isinstance(e, asyncio.CancelledError):
+                connecting.cancel()
+            else:
+                connecting.set_exception(e)
+                connecting.exception()  # Don't warn if nobody was waiting
+            raise
+        conn = PooledConnection(client)
+        async with self._lock:
+            self._pool.setdefault(key, []).append(conn)
+            self._pool.move_to_end(key)
+            if self._connecting.get(key) is connecting:
+                del self._connecting[key]
+        connecting.set_result(None)
+        return conn, False
+
+    async def _release(self, key: tuple, conn: PooledConnection, retire: bool = False):
+        """Give back a session slot; dead or retired connections are closed once unused"""
+        async with self._lock:
+            conn.in_use -= 1
+            conn.last_used = _mono()
+            if retire and not conn.retired:
+                # Keep it out of the pool but let commands still running on it finish
+                conn.retired = True
+                conns = self._pool.get(key, [])
+                if conn in conns:
+                    conns.remove(conn)
+                    if not conns:
+                        del self._pool[key]
+            if conn.in_use == 0 and (conn.retired or not self._is_alive(conn.client)):
+                self._remove(key, conn)
+            self._enforce_max_idle()
+
+    @staticmethod
+    def _open_channel(client: paramiko.SSHClient) -> paramiko.Channel:
+        """Open a session channel on a connected client (blocking)"""
+        transport = client.get_transport()
+        if transport is None:
+            raise paramiko.SSHException("SSH connection is closed")
+        return transport.open_session(timeout=settings.SSH_TIMEOUT)
+
+    async def _open_session(
+        self,
+        key: tuple,
+        host: str,
+        username: str,
+        port: int,
+        password: str = None,
+        ssh_key: str = None
+    ) -> Tuple[PooledConnection, paramiko.Channel]:
+        """
+        Open a channel on a pooled connection. If a reused connection can't open
+        one (e.g. a transport silently dropped by NAT), retire it and retry once
+        on a fresh connection.
+        """
+        for reuse in (True, False):
+            conn, reused = await self._acquire(key, host, username, port, password, ssh_key, reuse=reuse)
+            try:
+                chan = await asyncio.to_thread(self._open_channel, conn.client)
+            except (paramiko.SSHException, OSError, EOFError):
+                await self._release(key, conn, retire=True)
+                if not reused:
+                    raise
+            except BaseException:
+                await self._release(key, conn)
+                raise
             else:
-                raise ValueError("Either password or SSH key must be provided")
-            
-            # Execute command
-            stdin, stdout, stderr = client.exec_command(command, timeout=30)
-            
-            # Get output
-            output = stdout.read().decode('utf-8', errors='ignore')
-            error = stderr.read().decode('utf-8', errors='ignore')
-            
+                return conn, chan
+
+    @staticmethod
+    def _run(chan: paramiko.Channel, command: str) -> Tuple[str, str, int]:
+        """Run a command on an open session channel and close it (blocking)"""
+        try:
+            chan.exec_command(command)
+
+            # Drain stdout and stderr together so neither stalls the other
+            out_buf, err_buf = bytearray(), bytearray()
+            deadline = _mono() + settings.SSH_TIMEOUT
+            while True:
+                # Check EOF before reading: data arriving with EOF is buffered
+                # first, so one more empty read after seeing EOF means we're done
+                finished = chan.eof_received or chan.closed
+                received = False
+                if chan.recv_ready():
+                    out_buf += chan.recv(65536)
+                    received = True
+                if chan.recv_stderr_ready():
+                    err_buf += chan.recv_stderr(65536)
+                    received = True
+                if received:
+                    deadline = _mono() + settings.SSH_TIMEOUT
+                    continue
+                if finished:
+                    break
+                remaining = deadline - _mono()
+                if remaining <= 0:
+                    raise socket.timeout("Timed out waiting for command output")
+                select.select([chan], [], [], min(remaining, 1.0))
+
             # Get exit code
-            exit_code = stdout.channel.recv_exit_status()
-            
-            execution_time = time.time() - start_time
-            
+            exit_code = chan.recv_exit_status()
+        finally:
+            chan.close()
+
+        output = _decode(bytes(out_buf))
+        error = _decode(bytes(err_buf))
+        return output, error, exit_code
+
+    async def execute_command(
+        self,
+        host: str,
+        username: str,
+        port: int = 22,
+        password: str = None,
+        ssh_key: str = None,
+        command: str = "",
+        normalized: Optional[str] = None
+    ) -> Tuple[str, str, int, float]:
+        """
+        Execute a command on remote server via SSH
+
+        Pass normalized=normalize_command(command) if the caller already has it.
+
+        Returns: (output, error, exit_code, execution_time)
+        """
+        # Validate command (callers should precheck; the verdict is cached)
+        if not validator.is_command_allowed(command, normalized):
+            raise ValueError(f"Command not allowed: {command}")
+
+        start_time = _mono()
+        conn = None
+        key = self._pool_key(host, username, port, password, ssh_key)
+
+        try:
+            # Open a channel on a shared pooled connection
+            conn, chan = await self._open_session(key, host, username, port, password, ssh_key)
+
+            # Run the blocking paramiko calls in a worker thread
+            output, error, exit_code = await asyncio.to_thread(self._run, chan, command)
+
+            execution_time = _mono() - start_time
+
             return output, error, exit_code, execution_time
-            
-        except paramiko.AuthenticationException:
-            raise Exception("Authentication failed. Check credentials.")
+
+        except paramiko.AuthenticationException as e:
+            raise RuntimeError("Authentication failed. Check credentials.") from e
         except paramiko.SSHException as e:
-            raise Exception(f"SSH connection failed: {str(e)}")
-        except Exception as e:
-            raise Exception(f"Error executing command: {str(e)}")
+            raise RuntimeError(f"SSH connection failed: {str(e)}") from e
+        except (OSError, EOFError) as e:
+            # Socket errors and timeouts (socket.timeout is a TimeoutError), and the
+            # EOFError paramiko re-raises when the server has closed the transport
+            raise RuntimeError(f"Error executing command: {str(e)}") from e
         finally:
-            if client:
-                client.close()
+            if conn:
+                await self._release(key, conn)
+
+    @staticmethod
+    def _batch_script(marker: str, commands: List[str]) -> str:
+        """Build one shell script that runs each command and marks where its output ends"""
+        # Each command runs in its own quoted `sh -c`, so quotes, comments or a
+        # trailing backslash can't change how the rest of the script parses
+        return "\n".join(
+            f'sh -c {shlex.quote(command)}; echo "{marker}$?"; echo "{marker}" 1>&2'
+            for command in commands
+        )
+
+    @staticmethod
+    def _split_batch(marker: str, output: str, error: str, exit_code: int, count: int) -> List[Tuple[str, str, int]]:
+        """Split combined batch output back into one (output, error, exit_code) per command"""
+        # stdout reads "<out><marker><exit code>\n" per command, stderr "<err><marker>\n"
+        out_parts = re.split(f"{marker}(\\d+)\n", output)
+        err_parts = error.split(f"{marker}\n")
+        if len(out_parts) != 2 * count + 1 or len(err_parts) != count + 1:
+            raise BatchOutputError(output, error, exit_code)
+        return [
+            (out_parts[2 * i], err_parts[i], int(out_parts[2 * i + 1]))
+            for i in range(count)
+        ]
+
+    async def execute_batch(
+        self,
+        host: str,
+        username: str,
+        port: int = 22,
+        password: str = None,
+        ssh_key: str = None,
+        commands: List[str] = (),
+        normalized: Optional[List[str]] = None
+    ) -> Tuple[List[Tuple[str, str, int]], float]:
+        """
+        Execute several commands in order over a single SSH channel
+
+        Commands run one after another, each in its own `sh -c`, so a `cd`
+        doesn't carry over to the next command.
+
+        normalized, if given, holds normalize_command() of each command.
+
+        Returns: ([(output, error, exit_code), ...], execution_time)
+        Raises BatchOutputError with the raw output if it can't be split per command.
+        """
+        # Validate every command before running any of them
+        if normalized is None:
+            normalized = [None] * len(commands)
+        elif len(normalized) != len(commands):
+            # zip() would stop early and leave the extra commands unchecked
+            raise ValueError("normalized must hold one entry per command")
+        for command, command_lower in zip(commands, normalized):
+            if not validator.is_command_allowed(command, command_lower):
+                raise ValueError(f"Command not allowed: {command}")
+
+        # Each command is followed by a marker carrying its exit status, so one
+        # shell invocation replaces a channel round trip per command
+        marker = f"__BATCH_{uuid.uuid4().hex}__"
+        script = self._batch_script(marker, commands)
+
+        start_time = _mono()
+        conn = None
+        key = self._pool_key(host, username, port, password, ssh_key)
+
+        try:
+            conn, chan = await self._open_session(key, host, username, port, password, ssh_key)
+            output, error, exit_code = await asyncio.to_thread(self._run, chan, script)
+            execution_time = _mono() - start_time
+
+            return self._split_batch(marker, output, error, exit_code, len(commands)), execution_time
+
+        except paramiko.AuthenticationException as e:
+            raise RuntimeError("Authentication failed. Check credentials.") from e
+        except paramiko.SSHException as e:
+            raise RuntimeError(f"SSH connection failed: {str(e)}") from e
+        except (OSError, EOFError) as e:
+            # Socket errors and timeouts (socket.timeout is a TimeoutError), and the
+            # EOFError paramiko re-raises when the server has closed the transport
+            raise RuntimeError(f"Error executing command: {str(e)}") from e
+        finally:
+            if conn:
+                await self._release(key, conn)
 
     @staticmethod
     def test_connection(
@@ -92,35 +500,11 @@ class SSHManager:
         """Test SSH connection to server"""
         client = None
         try:
-            client = paramiko.SSHClient()
-            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            if ssh_key:
-                key_file = StringIO(ssh_key)
-                private_key = paramiko.RSAKey.from_private_key(key_file)
-                client.connect(
-                    hostname=host,
-                    username=username,
-                    pkey=private_key,
-                    port=port,
-                    timeout=10
-                )
-            elif password:
-                client.connect(
-                    hostname=host,
-                    username=username,
-                    password=password,
-                    port=port,
-                    timeout=10
-                )
-            else:
-                return False
-            
-            # Execute a simple test command
-            stdin, stdout, stderr = client.exec_command("echo 'Connection successful'")
-            output = stdout.read().decode().strip()
-            return "Connection successful" in output
-            
+            client = SSHManager._connect(host, username, port, password, ssh_key, timeout=10)
+
+            # connect() has already authenticated; just confirm the transport is up
+            return SSHManager._is_alive(client)
+
         except Exception:
             return False
         finally:
@@ -128,4 +512,4 @@ class SSHManager:
                 client.close()
 
 # Create SSH manager instance
-ssh_manager = SSHManager()
\ No newline at end of file
+ssh_manager = SSHManager()
@@ -0,0 +1,27 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("argon2")
+
+import auth
+from cache import cache, user_key
+
+def test_current_user_is_cached_without_password_hash(monkeypatch):
+    async def get_user_by_id(user_id):
+        return {"id": user_id, "email": "a@example.com", "hashed_password": "$argon2id$secret"}
+
+    monkeypatch.setattr(auth.db, "get_user_by_id", get_user_by_id)
+    token = auth.create_access_token(data={"sub": "u-cache-test"})
+
+    async def scenario():
+        await cache.delete(user_key("u-cache-test"))
+        user = await auth.get_current_user(SimpleNamespace(credentials=token))
+        return user, await cache.get(user_key("u-cache-test"))
+
+    user, cached = asyncio.run(scenario())
+
+    assert "hashed_password" not in user
+    assert cached == user
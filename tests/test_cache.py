@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+from cache import Cache
+
+fakeredis = pytest.importorskip("fakeredis")
+
+def test_incr_sets_expiry_once_in_the_same_transaction():
+    async def scenario():
+        cache = Cache()
+        cache._redis = fakeredis.FakeAsyncRedis()
+        counts = [await cache.incr("mail:u1:s1", 300) for _ in range(3)]
+        first_ttl = await cache._redis.ttl("mail:u1:s1")
+        await cache._redis.expire("mail:u1:s1", 100)
+        counts.append(await cache.incr("mail:u1:s1", 300))
+        ttl = await cache._redis.ttl("mail:u1:s1")
+        await cache.close()
+        return counts, first_ttl, ttl
+
+    counts, first_ttl, ttl = asyncio.run(scenario())
+
+    assert counts == [1, 2, 3, 4]
+    assert 290 < first_ttl <= 300
+    # Later increments don't push the window out
+    assert 0 < ttl <= 100
+
+def test_incr_falls_back_to_a_local_counter_when_redis_fails():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        server.connected = False  # Every command raises ConnectionError
+        cache = Cache()
+        cache._redis = fakeredis.FakeAsyncRedis(server=server)
+        counts = [await cache.incr("mail:u1:s1", 300) for _ in range(3)]
+        await cache._redis.aclose()
+        return counts
+
+    assert asyncio.run(scenario()) == [1, 2, 3]
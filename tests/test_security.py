@@ -0,0 +1,42 @@
+import random
+import re
+
+import pytest
+
+import security
+from security import validator
+
+# Inputs where RE2's ASCII-only \s used to disagree with stdlib re
+WHITESPACE_CASES = ["ps>\x0b/dev/sda", "cd rm\xa0-r\xa0", "echo x >\xa0/proc/sys", "ls; mkfs\x0b/dev/sdb"]
+
+FRAGMENTS = [
+    "rm", "-r", "-f", " ", "\t", "\n", "\x0b", "\x0c", "\xa0", " ", "chmod", "777",
+    ">", "/dev/sda", "/proc/", "dd", "if=", "of=", "mkfs", ":(){", ";", ":", "ls", "ps",
+    "cd ", "echo ", "cat ", "x",
+]
+
+def fuzzed_commands(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 8)))
+
+@pytest.fixture
+def verdicts_with(monkeypatch):
+    """Return a function that validates commands with _DANGER_RE compiled by the given engine"""
+    def verdicts(engine, commands):
+        pattern = "|".join(f"(?:{p})" for p in security._DANGEROUS_PATTERNS)
+        monkeypatch.setattr(security, "_DANGER_RE", engine.compile(pattern))
+        validator.cache_clear()
+        return [validator.is_command_allowed(command) for command in commands]
+    yield verdicts
+    validator.cache_clear()
+
+def test_re2_and_re_agree(verdicts_with):
+    re2 = pytest.importorskip("re2")
+    commands = WHITESPACE_CASES + list(fuzzed_commands(20000))
+
+    assert verdicts_with(re2, commands) == verdicts_with(re, commands)
+
+@pytest.mark.parametrize("command", WHITESPACE_CASES)
+def test_unicode_whitespace_does_not_hide_dangerous_patterns(command):
+    assert not validator.is_command_allowed(command)
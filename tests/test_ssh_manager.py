@@ -0,0 +1,192 @@
+import asyncio
+import os
+import socket
+import subprocess
+import time
+
+import paramiko
+import pytest
+
+from ssh_manager import SSHManager, BatchOutputError
+
+MARKER = "__BATCH_test__"
+
+def run_batch(commands, cwd):
+    """Run a batch script through a local shell, the way the remote side would"""
+    script = SSHManager._batch_script(MARKER, commands)
+    proc = subprocess.run(["sh", "-c", script], cwd=cwd, capture_output=True, text=True)
+    return SSHManager._split_batch(MARKER, proc.stdout, proc.stderr, proc.returncode, len(commands))
+
+@pytest.mark.parametrize("first", [
+    "echo hi #",
+    'echo "oops',
+    "ls (",
+    "echo trailing \\",
+    "echo it's",
+])
+def test_batch_command_text_cannot_break_framing(first, tmp_path):
+    results = run_batch(["mkdir x", first, "pwd"], tmp_path)
+
+    assert len(results) == 3
+    assert results[0][2] == 0 and (tmp_path / "x").is_dir()
+    assert results[2] == (f"{tmp_path}\n", "", 0)
+
+def test_batch_keeps_output_and_exit_codes_apart(tmp_path):
+    results = run_batch(["echo a", "cat missing", "printf no-newline"], tmp_path)
+
+    assert results[0] == ("a\n", "", 0)
+    assert results[1][0] == "" and results[1][2] != 0 and "missing" in results[1][1]
+    assert results[2] == ("no-newline", "", 0)
+
+def test_unsplittable_batch_output_keeps_raw_streams():
+    with pytest.raises(BatchOutputError) as excinfo:
+        SSHManager._split_batch(MARKER, "partial\n", "boom\n", 2, 2)
+
+    assert (excinfo.value.output, excinfo.value.error, excinfo.value.exit_code) == ("partial\n", "boom\n", 2)
+
+class LateEOFChannel:
+    """Fake channel whose last output and EOF land between the ready and EOF checks"""
+
+    def __init__(self):
+        self.closed = False
+        self._eof = False
+        self._out = bytearray()
+        self._polls = 0
+        # Always readable, so select() in _run returns at once
+        self._rfd, self._wfd = os.pipe()
+        os.write(self._wfd, b"x")
+
+    def fileno(self):
+        return self._rfd
+
+    @property
+    def eof_received(self):
+        return self._eof
+
+    def exec_command(self, command):
+        pass
+
+    def recv_ready(self):
+        return bool(self._out)
+
+    def recv_stderr_ready(self):
+        self._polls += 1
+        if self._polls == 1:
+            # Delivered after recv_ready() was checked on this pass
+            self._out += b"last line\n"
+            self._eof = True
+        return False
+
+    def recv(self, size):
+        data, self._out = bytes(self._out[:size]), self._out[size:]
+        return data
+
+    def recv_exit_status(self):
+        return 0
+
+    def close(self):
+        self.closed = True
+        os.close(self._rfd)
+        os.close(self._wfd)
+
+def test_run_reads_output_that_arrives_with_eof():
+    assert SSHManager._run(LateEOFChannel(), "echo") == ("last line\n", "", 0)
+
+class FakeClient:
+    """Client whose transport stays 'active' but may stop opening channels, like a NAT-dropped one"""
+
+    def __init__(self):
+        self.stale = False
+        self.closed = False
+
+    def get_transport(self):
+        return self
+
+    def is_active(self):
+        return not self.closed
+
+    def open_session(self, timeout=None):
+        if self.stale:
+            raise socket.timeout("Timed out opening channel")
+        return "chan"
+
+    def close(self):
+        self.closed = True
+
+def test_stale_pooled_connection_is_replaced(monkeypatch):
+    clients = []
+
+    def connect(host, username, port, password=None, ssh_key=None, timeout=None):
+        clients.append(FakeClient())
+        return clients[-1]
+
+    monkeypatch.setattr(SSHManager, "_connect", staticmethod(connect))
+    monkeypatch.setattr(SSHManager, "_run", staticmethod(lambda chan, command: (command, "", 0)))
+
+    async def scenario():
+        manager = SSHManager()
+        first = await manager.execute_command("h", "u", 22, "pw", None, "ls")
+        clients[0].stale = True
+        second = await manager.execute_command("h", "u", 22, "pw", None, "pwd")
+        pooled = [conn.client for conns in manager._pool.values() for conn in conns]
+        return first[:3], second[:3], pooled
+
+    first, second, pooled = asyncio.run(scenario())
+
+    assert first == ("ls", "", 0) and second == ("pwd", "", 0)
+    assert len(clients) == 2 and clients[0].closed
+    assert pooled == [clients[1]]
+
+def test_concurrent_first_commands_share_one_connect(monkeypatch):
+    clients = []
+
+    def connect(host, username, port, password=None, ssh_key=None, timeout=None):
+        time.sleep(0.05)
+        clients.append(FakeClient())
+        return clients[-1]
+
+    monkeypatch.setattr(SSHManager, "_connect", staticmethod(connect))
+    monkeypatch.setattr(SSHManager, "_run", staticmethod(lambda chan, command: (command, "", 0)))
+
+    async def scenario():
+        manager = SSHManager()
+        count = manager.max_sessions + 1
+        results = await asyncio.gather(*[
+            manager.execute_command("h", "u", 22, "pw", None, f"echo {i}") for i in range(count)
+        ])
+        return count, results
+
+    count, results = asyncio.run(scenario())
+
+    assert [result[0] for result in results] == [f"echo {i}" for i in range(count)]
+    # One connection fills its session slots before a second one is opened
+    assert len(clients) == 2
+
+def test_concurrent_callers_share_a_failed_connect(monkeypatch):
+    attempts = []
+
+    def connect(host, username, port, password=None, ssh_key=None, timeout=None):
+        attempts.append(1)
+        time.sleep(0.05)
+        raise paramiko.AuthenticationException("bad password")
+
+    monkeypatch.setattr(SSHManager, "_connect", staticmethod(connect))
+
+    async def scenario():
+        manager = SSHManager()
+        return await asyncio.gather(
+            *[manager.execute_command("h", "u", 22, "bad", None, "ls") for _ in range(4)],
+            return_exceptions=True
+        )
+
+    errors = asyncio.run(scenario())
+
+    assert len(attempts) == 1
+    assert all(isinstance(e, RuntimeError) and "Authentication failed" in str(e) for e in errors)
+
+def test_batch_rejects_mismatched_normalized_list():
+    async def scenario():
+        await SSHManager().execute_batch("h", "u", 22, "pw", None, ["ls", "rm -rf /"], normalized=["ls"])
+
+    with pytest.raises(ValueError):
+        asyncio.run(scenario())